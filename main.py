@@ -1,23 +1,88 @@
-from machine import Pin, UART
+from machine import Pin, UART, Timer
+from micropython import const
 import network
 import time
 import urequests
 import json
 import os
 import socket
+import select
+import ssl
+import gc
+import binascii
 
 # Core system configuration
-UART_BAUDRATE = 115200        # Communication speed with host
-WIFI_TIMEOUT = 10            # Seconds to wait for WiFi connection
+_UART_BAUDRATE = const(115200)    # Communication speed with host
+_WIFI_TIMEOUT = const(10)         # Seconds to wait for WiFi connection
+_RED_PIN = const(11)
+_YEL_PIN = const(12)
+_GRN_PIN = const(13)
+_LED_PERIOD_MS = const(50)    # How often the TX/RX LEDs are refreshed
+_HTTP_IDLE_MS = const(5000)   # Idle keep-alive connections are closed after this
+_DEBUG = const(0)             # Set to 1 to trace traffic on the REPL
 VERSION = "0.0.4"
 
+# Pre-encoded constant replies, written straight to the UART
+MSG_BANNER = ("\n'PICOJUICE " + VERSION + "\r\n").encode()
+MSG_VERSION = ("'PICOJUICE Version " + VERSION + "\r\n").encode()
+MSG_LIST = b"LIST\r\n"
+MSG_DISCONNECTED = b"'Disconnected\r\n"
+MSG_NOT_CONNECTED = b"'Not connected\r\n"
+MSG_CONNECTION_FAILED = b"'Connection failed\r\n"
+MSG_WIFI_RESET = b"'WiFi Reset\r\n"
+MSG_STATUS_ON = b"1\r\n"
+MSG_STATUS_OFF = b"0\r\n"
+MSG_BOOKMARK_SAVED = b"'Bookmark saved\r\n"
+MSG_NO_BOOKMARKS = b"'No bookmarks found\r\n"
+MSG_UDP_SENT = b"'UDP sent\r\n"
+MSG_FILE_SAVED = b"'File saved\r\n"
+MSG_FILE_DELETED = b"'File deleted\r\n"
+MSG_FILE_LOADED = b"'File loaded\r\n"
+MSG_NO_FILES = b"'No .IJB files found\r\n"
+MSG_MISSING_PARAMS = b"'Error: Missing parameters\r\n"
+MSG_MISSING_URL = b"'Error: Missing URL\r\n"
+MSG_MISSING_FILENAME = b"'Error: Missing filename\r\n"
+
+_HELP_TEXT = "\n".join([
+    "'PICOJUICE Commands:",
+    "'HELP - Show this help",
+    "'VER - Show firmware version",
+    "'APL - List available WiFi networks",
+    "'APC ssid password - Connect to WiFi",
+    "'APD - Disconnect from WiFi",
+    "'API - Show WiFi network info",
+    "'APS - Show WiFi connection status (0/1)",
+    "'APW - Show WiFi network name",
+    "'APR - Reset WiFi",
+    "'MAC - Show WiFi MAC address",
+    "'GET(S) url - HTTP GET(S)",
+    "'UDP ip port message - Send UDP",
+    "'LOAD filename - Load .IJB file",
+    "'SAVE filename - Save to file",
+    "'DIR - List .IJB files",
+    "'DEL filename - Delete .IJB file",
+    "'BOOKMARK **key url - Save URL bookmark",
+    "'BOOKMARKS - List all saved URL bookmarks"
+])
+MSG_HELP = (_HELP_TEXT + "\r\n").encode()
+
+def _find_sep(text, start):
+    # Index of the next space or tab at or after start, or -1
+    i = text.find(' ', start)
+    j = text.find('\t', start)
+    if i < 0:
+        return j
+    if j < 0:
+        return i
+    return i if i < j else j
+
 class Hardware:
     def __init__(self):
         # LED initialization
         self.led = Pin("LED", Pin.OUT)     # PicoW On-board LED used as READY indicator 
-        self.red_led = Pin(11, Pin.OUT)    # TX indicator
-        self.yellow_led = Pin(12, Pin.OUT)  # RX indicator
-        self.green_led = Pin(13, Pin.OUT)   # WiFi status
+        self.red_led = Pin(_RED_PIN, Pin.OUT)    # TX indicator
+        self.yellow_led = Pin(_YEL_PIN, Pin.OUT)  # RX indicator
+        self.green_led = Pin(_GRN_PIN, Pin.OUT)   # WiFi status
         
         # Set initial LED states to off
         self.led.off()
@@ -26,15 +91,66 @@ class Hardware:
         self.green_led.off()
         
         # Initialize UART and WiFi
-        self.uart = UART(0, baudrate=UART_BAUDRATE)
+        self.uart = UART(0, baudrate=_UART_BAUDRATE, timeout=5000, timeout_char=20)
         self.wlan = network.WLAN(network.STA_IF)
         self.wlan.active(True)
         
+        # Single UDP socket shared by every UDP command
+        self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        
 
 class PicoJuice:
+    # Command name -> (method name, argument count, reply when arguments are missing)
+    _DISPATCH = {
+        'VER': ('_cmd_ver', 0, None),
+        'MAC': ('get_mac_address', 0, None),
+        'HELP': ('_cmd_help', 0, None),
+        'APL': ('handle_apl', 0, None),
+        'APC': ('handle_apc', 2, MSG_MISSING_PARAMS),
+        'APD': ('handle_apd', 0, None),
+        'APR': ('handle_apr', 0, None),
+        'API': ('handle_api', 0, None),
+        'APS': ('handle_aps', 0, None),
+        'APW': ('handle_apw', 0, None),
+        'GET': ('handle_get', 1, MSG_MISSING_URL),
+        'GETS': ('_cmd_gets', 1, MSG_MISSING_URL),
+        'UDP': ('_cmd_udp', 2, MSG_MISSING_PARAMS),
+        'SAVE': ('handle_save', 1, MSG_MISSING_FILENAME),
+        'DIR': ('handle_dir', 0, None),
+        'DEL': ('handle_del', 1, MSG_MISSING_FILENAME),
+        'LOAD': ('handle_load', 1, MSG_MISSING_FILENAME),
+        'BOOKMARK': ('handle_bookmark', 2, MSG_MISSING_PARAMS),
+        'BOOKMARKS': ('handle_list_bookmarks', 0, None),
+    }
+
     def __init__(self):
         # Initialize hardware interface
         self.hw = Hardware()
+        
+        # Collect early and collect more often, so long-lived buffers below sit
+        # at the bottom of the heap and the rest stays contiguous for TLS/lwIP
+        gc.collect()
+        gc.threshold(gc.mem_free() // 4 + gc.mem_alloc())
+        
+        # Receive buffer, reused for every incoming line
+        self._rx_buf = bytearray(512)
+        self._rx_mv = memoryview(self._rx_buf)
+        self._rx_len = 0
+        
+        # TX/RX activity flags, shown on the LEDs by a timer instead of per write
+        self._tx_active = False
+        self._rx_active = False
+        self._tx_lit = False
+        self._rx_lit = False
+        self._led_timer = Timer(period=_LED_PERIOD_MS, mode=Timer.PERIODIC, callback=self._led_tick)
+        
+        # Resolved UDP destinations keyed by (ip, port) as received
+        self._addr_cache = {}
+        
+        # Single keep-alive HTTP(S) connection, keyed by (scheme, host, port)
+        self._http_sock = None
+        self._http_key = None
+        self._http_used = 0
         time.sleep(5)  # Startup delay for system stability. Not required, but why not?.
         
         # Create PROGRAMS directory if it doesn't exist
@@ -49,12 +165,19 @@ class PicoJuice:
         # Wait for initial handshake. 
         # Yellow LED might also light up during this time.
         while True:
-            line = self.read_line()
+            try:
+                line = self.read_line()
+            except UnicodeError:
+                continue
             if line == "OK":
                 break
         
         # Display startup banner
-        self.send_response(f"\n'PICOJUICE {VERSION}")
+        self.send_bytes(MSG_BANNER)
+        
+        # MicroPython's first json.loads() is much slower unless the codec has
+        # been used once, so warm it up before parsing bookmarks and wifi.json
+        json.dumps(None)
         
         # Initialize and load bookmarks
         self.bookmarks = {}
@@ -63,7 +186,7 @@ class PicoJuice:
         # Restore previous WiFi connection if possible
         try:
             with open('wifi.json', 'r') as f:
-                creds = json.load(f)
+                creds = json.loads(f.read())
                 ip = self.wifi_connect(creds['ssid'], creds['password'])
                 if ip:
                     self.send_response(f"'Connected to {creds['ssid']}, IP: {ip}")
@@ -75,7 +198,7 @@ class PicoJuice:
     def load_bookmarks(self):
         try:
             with open('bookmarks.json', 'r') as f:
-                self.bookmarks = json.load(f)
+                self.bookmarks = json.loads(f.read())
         except:
             self.bookmarks = {}
 
@@ -84,66 +207,95 @@ class PicoJuice:
             return "'Bookmark keys must start with **"
         
         self.bookmarks[key] = url
+        data = json.dumps(self.bookmarks)
         with open('bookmarks.json', 'w') as f:
-            json.dump(self.bookmarks, f)
-        self.load_bookmarks()
-        return "'Bookmark saved"
+            f.write(data)
+        return MSG_BOOKMARK_SAVED
 
     def handle_list_bookmarks(self):
         if not self.bookmarks:
-            return "'No bookmarks found"
+            return MSG_NO_BOOKMARKS
         return '\n'.join(f"'{key}: {url}" for key, url in self.bookmarks.items())
 
     def resolve_bookmark(self, url_or_key):
         resolved = url_or_key
         if url_or_key.startswith('**'):
             resolved = self.bookmarks.get(url_or_key, url_or_key)
-        print(resolved)
+        if _DEBUG:
+            print(resolved)
         return resolved
 
+    def _led_tick(self, _timer):
+        if self._tx_active != self._tx_lit:
+            self._tx_lit = self._tx_active
+            self.hw.red_led.value(self._tx_lit)
+        self._tx_active = False
+        if self._rx_active != self._rx_lit:
+            self._rx_lit = self._rx_active
+            self.hw.yellow_led.value(self._rx_lit)
+        self._rx_active = False
+
     def read_line(self):
-        buffer = []
-        self.hw.yellow_led.on()
+        buf = self._rx_buf
+        size = len(buf)
+        n = self._rx_len
+        start = 0
+        eol = -1
+        overflow = None
         
+        # Read in chunks straight into the buffer until a line terminator shows up
         while True:
-            if self.hw.uart.any():
-                char = self.hw.uart.read(1).decode('ascii')
-                if char in '\r\n':
-                    received = ''.join(buffer).strip()
-                    print("Received:", received)
-                    self.hw.yellow_led.off()
-                    return received
-                buffer.append(char)
-            time.sleep(0.01)
+            for i in range(start, n):
+                if buf[i] == 13 or buf[i] == 10:
+                    eol = i
+                    break
+            if eol >= 0:
+                break
+            if n == size:
+                # The line has outgrown the buffer: spill it into a temporary
+                # bytearray so the long-lived buffer keeps its size
+                if overflow is None:
+                    overflow = bytearray()
+                overflow.extend(self._rx_mv[:n])
+                n = 0
+                start = 0
+                continue
+            start = n
+            got = self.hw.uart.readinto(self._rx_mv[n:min(n + 64, size)])
+            if got:
+                n += got
+        
+        try:
+            if overflow is None:
+                received = str(self._rx_mv[:eol], 'ascii').strip()
+            else:
+                overflow.extend(self._rx_mv[:eol])
+                received = str(overflow, 'ascii').strip()
+        finally:
+            # Drop the line from the buffer even if it fails to decode, and keep
+            # anything received after the terminator for the next call
+            rest = n - eol - 1
+            if rest:
+                self._rx_mv[:rest] = self._rx_mv[eol + 1:n]
+            self._rx_len = rest
+        
+        self._rx_active = True
+        if _DEBUG:
+            print("Received:", received)
+        return received
 
     def send_response(self, text):
-        print("Sent:", text)
-        self.hw.red_led.on()
+        if _DEBUG:
+            print("Sent:", text)
+        self._tx_active = True
         self.hw.uart.write(f"{text}\r\n".encode())
-        self.hw.red_led.off()
-
-    def get_help_text(self):
-        return "\n".join([
-            "'PICOJUICE Commands:",
-            "'HELP - Show this help",
-            "'VER - Show firmware version",
-            "'APL - List available WiFi networks",
-            "'APC ssid password - Connect to WiFi",
-            "'APD - Disconnect from WiFi",
-            "'API - Show WiFi network info",
-            "'APS - Show WiFi connection status (0/1)",
-            "'APW - Show WiFi network name",
-            "'APR - Reset WiFi",
-            "'MAC - Show WiFi MAC address",
-            "'GET(S) url - HTTP GET(S)",
-            "'UDP ip port message - Send UDP",
-            "'LOAD filename - Load .IJB file",
-            "'SAVE filename - Save to file",
-            "'DIR - List .IJB files",
-            "'DEL filename - Delete .IJB file",
-            "'BOOKMARK **key url - Save URL bookmark",
-            "'BOOKMARKS - List all saved URL bookmarks"
-        ])
+
+    def send_bytes(self, data):
+        # data is pre-encoded and already terminated
+        if _DEBUG:
+            print("Sent:", data)
+        self._tx_active = True
+        self.hw.uart.write(data)
 
     def normalize_url(self, url):
         if url.upper().startswith('HTTP://'):
@@ -154,19 +306,20 @@ class PicoJuice:
 
     def handle_apl(self):
         connected_ssid = self.hw.wlan.config('ssid') if self.hw.wlan.isconnected() else None
-        return '\n'.join(
-            f"'{'*' if net[0].decode('utf-8') == connected_ssid else ''}{net[0].decode('utf-8')}"
-            for net in self.hw.wlan.scan()
-        )
+        parts = []
+        for net in self.hw.wlan.scan():
+            name = net[0].decode('utf-8')
+            parts.append("'*" + name if name == connected_ssid else "'" + name)
+        return '\n'.join(parts)
 
     def handle_apc(self, ssid, password):
         ip = self.wifi_connect(ssid, password)
-        return f"'Connected to {ssid}, IP: {ip}" if ip else "'Connection failed"
+        return f"'Connected to {ssid}, IP: {ip}" if ip else MSG_CONNECTION_FAILED
 
     def handle_apd(self):
         self.hw.wlan.disconnect()
         self.hw.green_led.off()
-        return "'Disconnected"
+        return MSG_DISCONNECTED
 
     def handle_apr(self):
         self.hw.wlan.disconnect()
@@ -174,23 +327,23 @@ class PicoJuice:
         self.hw.green_led.off()
         time.sleep(1)
         self.hw.wlan.active(True)
-        return "'WiFi Reset"
+        return MSG_WIFI_RESET
 
     def handle_api(self):
         if self.hw.wlan.isconnected():
             status = self.hw.wlan.ifconfig()
             return f"'Connected, IP: {status[0]}, Netmask: {status[1]}, Gateway: {status[2]}"
-        return "'Not connected"
+        return MSG_NOT_CONNECTED
 
     def handle_aps(self):
-        return "1" if self.hw.wlan.isconnected() else "0"
+        return MSG_STATUS_ON if self.hw.wlan.isconnected() else MSG_STATUS_OFF
 
     def handle_apw(self):
-        return f"'{self.hw.wlan.config('ssid')}" if self.hw.wlan.isconnected() else "'Not connected"
+        return f"'{self.hw.wlan.config('ssid')}" if self.hw.wlan.isconnected() else MSG_NOT_CONNECTED
 
     def wifi_connect(self, ssid, password):
         self.hw.wlan.connect(ssid, password)
-        for _ in range(WIFI_TIMEOUT):
+        for _ in range(_WIFI_TIMEOUT):
             if self.hw.wlan.isconnected():
                 self.save_wifi_credentials(ssid, password)
                 self.hw.green_led.on()
@@ -200,8 +353,152 @@ class PicoJuice:
         return None
 
     def save_wifi_credentials(self, ssid, password):
+        data = json.dumps({'ssid': ssid, 'password': password})
         with open('wifi.json', 'w') as f:
-            json.dump({'ssid': ssid, 'password': password}, f)
+            f.write(data)
+
+    def _http_close(self):
+        if self._http_sock is not None:
+            try:
+                self._http_sock.close()
+            except:
+                pass
+        self._http_sock = None
+        self._http_key = None
+
+    def _http_expire(self):
+        # Free the connection (and any TLS buffers) once it has sat idle too long
+        if self._http_sock is not None and time.ticks_diff(time.ticks_ms(), self._http_used) > _HTTP_IDLE_MS:
+            self._http_close()
+
+    def _http_connect(self, scheme, host, port):
+        addr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][-1]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(10)
+            sock.connect(addr)
+            if scheme == 'https':
+                sock = ssl.wrap_socket(sock, server_hostname=host)
+        except:
+            sock.close()
+            raise
+        return sock
+
+    def _http_read(self, sock, n):
+        chunks = []
+        while n > 0:
+            data = sock.read(n)
+            if not data:
+                raise OSError("Connection closed")
+            chunks.append(data)
+            n -= len(data)
+        return b''.join(chunks)
+
+    def _http_readline(self, sock):
+        line = sock.readline()
+        if not line:
+            raise OSError("Connection closed")
+        return line
+
+    def _http_exchange(self, sock, host, path):
+        # host is the Host header value, including any non-default port.
+        # Returns (status, body, keep_alive)
+        sock.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode())
+        while True:
+            parts = self._http_readline(sock).split(None, 2)
+            status = int(parts[1])
+            if status >= 200:
+                break
+            # Interim 1xx reply: skip its headers, the real response follows
+            while self._http_readline(sock) != b'\r\n':
+                pass
+        
+        # HTTP/1.1 is persistent unless told otherwise, HTTP/1.0 only on request
+        length = None
+        chunked = False
+        keep_alive = parts[0] != b'HTTP/1.0'
+        while True:
+            line = self._http_readline(sock)
+            if line == b'\r\n':
+                break
+            header = line.decode().lower()
+            if header.startswith('content-length:'):
+                length = int(header[15:])
+            elif header.startswith('transfer-encoding:') and 'chunked' in header:
+                chunked = True
+            elif header.startswith('connection:'):
+                if 'close' in header:
+                    keep_alive = False
+                elif 'keep-alive' in header:
+                    keep_alive = True
+        
+        if status == 204 or status == 304:
+            # These never carry a body, whatever the headers say
+            body = b''
+        elif chunked:
+            parts = []
+            while True:
+                size = int(sock.readline().split(b';')[0], 16)
+                if size == 0:
+                    # Skip any trailers up to the closing blank line
+                    while sock.readline() not in (b'\r\n', b''):
+                        pass
+                    break
+                parts.append(self._http_read(sock, size))
+                sock.readline()
+            body = b''.join(parts)
+        elif length is not None:
+            body = self._http_read(sock, length)
+        elif not keep_alive:
+            # No framing, the body runs until the server closes the connection
+            body = sock.read()
+        else:
+            raise ValueError("Unframed keep-alive response")
+        return status, body, keep_alive
+
+    def _http_get(self, url):
+        # GET over the cached keep-alive connection, opening a new one on a miss.
+        # Returns the body text, or None when urequests should handle the URL.
+        # Connection errors propagate; ValueError means the reply couldn't be handled here.
+        scheme, _, rest = url.partition('://')
+        host, slash, path = rest.partition('/')
+        path = '/' + path if slash else '/'
+        if ':' in host:
+            host, port = host.split(':', 1)
+            port = int(port)
+        else:
+            port = 443 if scheme == 'https' else 80
+        key = (scheme, host, port)
+        host_header = host if port == (443 if scheme == 'https' else 80) else f"{host}:{port}"
+        
+        self._http_expire()
+        if self._http_key != key:
+            self._http_close()
+        for _ in range(2):
+            reused = self._http_sock is not None
+            if not reused:
+                self._http_sock = self._http_connect(scheme, host, port)
+                self._http_key = key
+            try:
+                status, body, keep_alive = self._http_exchange(self._http_sock, host_header, path)
+            except OSError:
+                self._http_close()
+                if reused:
+                    # The server probably dropped the idle connection, retry once on a fresh one
+                    continue
+                raise
+            except Exception:
+                self._http_close()
+                raise
+            if keep_alive:
+                self._http_used = time.ticks_ms()
+            else:
+                self._http_close()
+            if status in (301, 302, 303, 307, 308):
+                # Leave redirects to urequests
+                return None
+            return body.decode('utf-8')
+        return None
 
     def handle_get(self, url, secure=False):
         if not self.hw.wlan.isconnected():
@@ -211,108 +508,194 @@ class PicoJuice:
         if not any(resolved_url.lower().startswith(proto.lower()) for proto in ('http://', 'https://')):
             resolved_url = f"{'https' if secure else 'http'}://{resolved_url}"
 
-        print(resolved_url)
+        if _DEBUG:
+            print(resolved_url)
         try:
             normalized_url = self.normalize_url(resolved_url)
+            # Connection failures are reported as-is, only replies the keep-alive
+            # path can't handle are retried through urequests
+            try:
+                text = self._http_get(normalized_url)
+            except ValueError as e:
+                if _DEBUG:
+                    print("Keep-alive GET failed:", repr(e))
+                text = None
+            if text is not None:
+                return text
             response = urequests.get(normalized_url)
             text = response.text
             response.close()
             return text
         except Exception as e:
-            print("Full exception:", repr(e))
+            if _DEBUG:
+                print("Full exception:", repr(e))
             return f"'{str(e)}"
 
     def handle_udp(self, ip, port, message):
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.sendto(message.encode(), (ip, int(port)))
-            sock.close()
-            return "'UDP sent"
+            key = (ip, port)
+            addr = self._addr_cache.get(key)
+            if addr is None:
+                if len(self._addr_cache) >= 8:
+                    self._addr_cache.clear()
+                addr = (ip, int(port))
+                self._addr_cache[key] = addr
+            self.hw.udp_sock.sendto(message.encode(), addr)
+            return MSG_UDP_SENT
         except Exception as e:
             return f"'Error: {str(e)}"
 
     def handle_save(self, filename):
-        self.send_response("LIST")
-        collected = []
-        first_ok = True
+        path = f"PROGRAMS/{filename}.IJB"
+        tmp_path = f"PROGRAMS/{filename}.tmp"
+        try:
+            f = open(tmp_path, 'w')
+        except OSError:
+            return "'Error saving file"
         
-        while True:
-            line = self.read_line()
-            if line == "OK":
-                if first_ok:
-                    first_ok = False
-                else:
-                    with open(f"PROGRAMS/{filename}.IJB", 'w') as f:
-                        f.write('\n'.join(collected))
-                    return "'File saved"
-            elif line:
-                collected.append(line)
+        # Lines are written to a temporary file as they arrive rather than
+        # collected in memory; the existing program is only replaced on the final OK
+        self.send_bytes(MSG_LIST)
+        first_ok = True
+        first_line = True
+        try:
+            while True:
+                line = self.read_line()
+                if line == "OK":
+                    if first_ok:
+                        first_ok = False
+                    else:
+                        f.close()
+                        try:
+                            os.rename(tmp_path, path)
+                        except OSError:
+                            # Some filesystems won't rename over an existing file
+                            os.remove(path)
+                            os.rename(tmp_path, path)
+                        return MSG_FILE_SAVED
+                elif line:
+                    if not first_line:
+                        f.write('\n')
+                    f.write(line)
+                    first_line = False
+        except Exception:
+            f.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return "'Error saving file"
 
     def handle_dir(self):
         files = [f for f in os.listdir('PROGRAMS') if f.endswith('.IJB')]
         if not files:
-            return "'No .IJB files found"
+            return MSG_NO_FILES
         return '\n'.join(f"'{f} {os.stat('PROGRAMS/' + f)[6]}" for f in files)
 
     def handle_del(self, filename):
         try:
             os.remove(f"PROGRAMS/{filename}.IJB")
-            return "'File deleted"
+            return MSG_FILE_DELETED
         except:
             return "'Error deleting file"
 
     def handle_load(self, filename):
         try:
-            with open(f"PROGRAMS/{filename}.IJB", 'r') as f:
+            with open(f"PROGRAMS/{filename}.IJB", 'rb') as f:
+                uart = self.hw.uart
+                # Raw bytes go straight to the UART, no per-line decode or formatting
                 for line in f:
-                    self.send_response(line.strip())
-            return "'File loaded"
+                    uart.write(line.strip())
+                    uart.write(b"\r\n")
+                    self._tx_active = True
+            return MSG_FILE_LOADED
         except:
             return "'Error loading file"
+
     def get_mac_address(self):
-        mac = self.hw.wlan.config('mac')
-        return f"'{''.join([f'{b:02x}' for b in mac])}"
+        return "'" + binascii.hexlify(self.hw.wlan.config('mac')).decode()
+
+    def _cmd_ver(self):
+        return MSG_VERSION
+
+    def _cmd_help(self):
+        return MSG_HELP
+
+    def _cmd_gets(self, url):
+        return self.handle_get(url, secure=True)
+
+    def _cmd_udp(self, ip, rest):
+        # rest is "port message"; the message may itself contain spaces
+        parts = rest.split(None, 1)
+        if len(parts) < 2:
+            return MSG_MISSING_PARAMS
+        return self.handle_udp(ip, parts[0], parts[1])
 
     def handle_command(self, cmd):
-        parts = cmd.strip().split(None, 2)
-        command = parts[0].upper()
+        cmd = cmd.strip()
+        if not cmd:
+            return None
         
-        handlers = {
-            'VER': lambda: f"'PICOJUICE Version {VERSION}",
-            'MAC': self.get_mac_address,
-            'HELP': self.get_help_text,
-            'APL': self.handle_apl,
-            'APC': lambda: self.handle_apc(parts[1], parts[2]) if len(parts) >= 3 else "'Error: Missing parameters",
-            'APD': self.handle_apd,
-            'APR': self.handle_apr,
-            'API': self.handle_api,
-            'APS': self.handle_aps,
-            'APW': self.handle_apw,
-            'GET': lambda: self.handle_get(parts[1]) if len(parts) >= 2 else "'Error: Missing URL",
-            'GETS': lambda: self.handle_get(parts[1], secure=True) if len(parts) >= 2 else "'Error: Missing URL",
-            'UDP': lambda: self.handle_udp(parts[1], parts[2], parts[3]) if len(parts) >= 4 else "'Error: Missing parameters",
-            'SAVE': lambda: self.handle_save(parts[1]) if len(parts) >= 2 else "'Error: Missing filename",
-            'DIR': self.handle_dir,
-            'DEL': lambda: self.handle_del(parts[1]) if len(parts) >= 2 else "'Error: Missing filename",
-            'LOAD': lambda: self.handle_load(parts[1]) if len(parts) >= 2 else "'Error: Missing filename",
-            'BOOKMARK': lambda: self.handle_bookmark(parts[1], parts[2]) if len(parts) >= 3 else "'Error: Missing parameters",
-            'BOOKMARKS': self.handle_list_bookmarks
-        }
+        # Split "NAME a b..." on spaces/tabs by hand, only slicing out the
+        # arguments the command takes
+        i = _find_sep(cmd, 0)
+        entry = self._DISPATCH.get((cmd if i < 0 else cmd[:i]).upper())
+        if entry is None:
+            return None
+        nargs = entry[1]
+        if nargs == 0:
+            return getattr(self, entry[0])()
+        if i < 0:
+            return entry[2]
         
-        if command in handlers:
-            return handlers[command]()
-        return None
+        # cmd is stripped, so skipping separators always stops on a character
+        while cmd[i] in ' \t':
+            i += 1
+        j = _find_sep(cmd, i)
+        if nargs == 1:
+            return getattr(self, entry[0])(cmd[i:] if j < 0 else cmd[i:j])
+        if j < 0:
+            return entry[2]
+        a = cmd[i:j]
+        while cmd[j] in ' \t':
+            j += 1
+        return getattr(self, entry[0])(a, cmd[j:])
 
     def run(self):
+        # Sleep in the UART driver until data arrives. Ports whose UART
+        # can't be polled fall back to a slow sleep loop.
+        try:
+            poller = select.poll()
+            poller.register(self.hw.uart, select.POLLIN)
+        except (AttributeError, OSError, TypeError):
+            poller = None
+        
         while True:
-            if self.hw.uart.any():
+            if self._rx_len:
+                ready = True
+            elif poller is not None:
+                ready = poller.poll(1000)
+            else:
+                time.sleep_ms(50)
+                ready = self.hw.uart.any()
+            if not ready:
+                self._http_expire()
+                continue
+            try:
                 line = self.read_line()
-                if line and line.upper().startswith('MJ'):
-                    cmd = line[line.upper().find('MJ')+2:]
-                    response = self.handle_command(cmd)
-                    if response:
-                        self.send_response(response)
-            time.sleep(0.01)
+            except UnicodeError:
+                # read_line() has already dropped the undecodable line
+                continue
+            # Case-insensitive "MJ" prefix check without uppercasing the line
+            if len(line) >= 2 and line[0] in 'Mm' and line[1] in 'Jj':
+                cmd = line[2:]
+                response = self.handle_command(cmd)
+                if isinstance(response, bytes):
+                    self.send_bytes(response)
+                elif response:
+                    self.send_response(response)
+                response = None
+                gc.collect()
 
 def main():
     pico = PicoJuice()